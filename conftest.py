@@ -0,0 +1 @@
+# Puts the repository root on sys.path, so a plain `pytest` run can import scan_engine
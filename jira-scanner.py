@@ -1,17 +1,24 @@
 import os
 import csv
-import regex as re
+import codecs
+import hashlib
+import json
+import atexit
 import logging
 import requests
 import time  
 from http.client import IncompleteRead
 from requests.auth import HTTPBasicAuth
-from threading import Thread
+from threading import Thread, Lock, Condition, local
+from collections import OrderedDict
 from queue import Queue
 from requests.exceptions import ChunkedEncodingError
 from requests.adapters import HTTPAdapter
 from urllib3.exceptions import ProtocolError
-from requests import Retry
+from urllib3.util.retry import Retry
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from scan_engine import FalsePositiveStore, FindingsSink, RateLimiter, RuleSet
 
 ########################
 # Configurations
@@ -21,17 +28,46 @@ CONFIG = {
     'email': '<email>', 
     'token' : "",  
     'base_url' : "https://<domain>.atlassian.net",
+    'output_format': 'csv',  # Findings file format: 'csv', 'jsonl' or 'sarif'
+    'hydrate_issues': True,  # Embed comments, attachments and changelog in the search response
+    'search_endpoint': 'jql',  # 'jql' for the nextPageToken search, 'legacy' for the startAt search
+    'search_page_size': 100,  # Issues requested per search page, Jira may return fewer
+    'bulk_changelog': True,  # Fetch description history per search page with the bulk changelog endpoint
+    'http_pool_size': 4,  # Connections kept alive per worker thread session
+    'project_threads': 2,  # Threads paging through project searches and feeding the issue workers
+    'issue_queue_per_worker': 20,  # Issues buffered per issue worker before the project threads wait
+    'incremental': False,  # Only scan issues updated since the last run of each project
+    'watermark_overlap_minutes': 1440,  # Rescan window before each watermark, covers the Jira user's timezone offset
+    'attachment_chunk_bytes': 1024 * 1024,  # Attachments are downloaded and scanned in chunks of this size
+    'max_attachment_bytes': 100 * 1024 * 1024,  # Only the first bytes of larger attachments are scanned
+    'attachment_cache_entries': 200000,  # Attachment scan results kept between runs, least recently used are evicted
+    'attachment_hash_max_bytes': 1024 * 1024,  # Attachments up to this size are also deduplicated by content hash
+    'requests_per_second': 10,  # Starting API request rate, adapted to throttling responses
+    'max_requests_per_second': 100,
+    'max_concurrent_requests': 12,  # API requests in flight across all threads, halved while throttled
+    'throttle_retries': 5,  # Retries of a request answered with 429
+    'rule_timeout_seconds': 5,  # Time one rule may spend on one text before its result is inconclusive
+    'rule_quarantine_after': 3,  # Timeouts after which a rule is no longer run
+    'regex_backend': 'regex',  # 'regex', 're' (only without a rule timeout) or 're2' (linear time, needs google-re2); unsupported rules fall back to 'regex'
 }
 
 REGEX_PATTERNS_FILE = 'regex_patterns.csv'
 FALSE_POSITIVES = 'jira_false_positive.txt'
+LEGACY_FALSE_POSITIVES = 'false_positive.txt'
 FOUND_ISSUES_FILE = 'jira_found_issues.csv'
 RUNNING_PROJECTS_FILE = 'jira_running_projects.txt'
 LOG_FILE = 'jira_application.log'
 PROCESSED_PROJECTS_FILE = 'jira_processed_projects.csv'
+WATERMARKS_FILE = 'jira_watermarks.json'
+ATTACHMENT_CACHE_FILE = 'jira_attachment_cache.json'
 
 AUTH = HTTPBasicAuth(CONFIG['email'], CONFIG['token'])
 HEADERS = {"Accept": "application/json"}
+ISSUE_FIELDS = 'updated,description,comment,attachment'
+CSV_LOCK = Lock()
+ADF_INLINE_NODES = {'text', 'mention', 'emoji', 'hardBreak', 'inlineCard', 'date', 'status', 'mediaInline', 'placeholder', 'inlineExtension'}
+WATERMARKS_LOCK = Lock()
+THREAD_STATE = local()
 
 
 ########################
@@ -83,32 +119,76 @@ def load_project_keys(file_path='projects.txt'):
         logging.error(f"Failed to read project keys from {file_path}: {e}")
         return None
 
-def download_attachment(download_url):
-    session = setup_retry_session()
+def decode_chunks(byte_chunks, encoding='utf-8'):
+    """Decode a stream of byte chunks incrementally, replacing invalid sequences."""
+    try:
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    except LookupError:
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    for chunk in byte_chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+def limit_chunks(byte_chunks, max_bytes, download_url):
+    """Yield byte chunks until max_bytes have been read."""
+    read = 0
+    for chunk in byte_chunks:
+        if read + len(chunk) > max_bytes:
+            yield chunk[:max_bytes - read]
+            logging.warning(f"Attachment {download_url} is larger than {max_bytes} bytes, only the first {max_bytes} bytes were scanned.")
+            return
+        read += len(chunk)
+        yield chunk
+
+def scan_attachment(download_url, size=None, inconclusive=None):
+    """Stream an attachment through the rule set and return its (rule_name, start, end) matches, or None on failure.
+
+    The content is never held in memory as a whole: it is read in chunks of
+    CONFIG['attachment_chunk_bytes'], capped at CONFIG['max_attachment_bytes'],
+    and the download stops early once every rule has matched. Attachments of
+    at most CONFIG['attachment_hash_max_bytes'] are read whole instead, so a
+    copy of content scanned before is recognised by its SHA-256. Rules that
+    time out are appended to inconclusive, and such results are not cached.
+    """
+    if inconclusive is None:
+        inconclusive = []
     attempt = 0
     max_attempts = 5
     while attempt < max_attempts:
         try:
-            response = session.get(download_url, auth=AUTH, headers=HEADERS, timeout=120)
-            response.raise_for_status()  # Raises a HTTPError for bad responses
-            content_type = response.headers.get('Content-Type')
-        
-            # If the content type is text, decode it, otherwise return the bytes
-            if 'text' in content_type:
-                return response.text  # Decodes using response encoding
-            else:
-                return response.content  # Return bytes for binary content
+            with api_get(download_url, auth=AUTH, headers=HEADERS, timeout=120, stream=True) as response:
+                response.raise_for_status()  # Raises a HTTPError for bad responses
+                content_type = response.headers.get('Content-Type') or ''
+                encoding = content_type.split('charset=')[1].split(';')[0].strip() if 'charset=' in content_type else 'utf-8'
+                if size is not None and size <= CONFIG['attachment_hash_max_bytes']:
+                    content = response.content
+                    cache_key = f"sha256:{hashlib.sha256(content).hexdigest()}"
+                    matches = ATTACHMENT_CACHE.get(cache_key)
+                    if matches is None:
+                        matches = RULE_SET.scan(''.join(decode_chunks([content], encoding)), inconclusive=inconclusive)
+                        if not inconclusive:
+                            ATTACHMENT_CACHE.put(cache_key, matches)
+                    else:
+                        logging.info(f"Attachment {download_url} has the same content as one scanned before, reusing its result.")
+                    return matches
+                byte_chunks = limit_chunks(response.iter_content(chunk_size=CONFIG['attachment_chunk_bytes']), CONFIG['max_attachment_bytes'], download_url)
+                return RULE_SET.scan_stream(decode_chunks(byte_chunks, encoding), inconclusive=inconclusive)
 
         except (requests.exceptions.RequestException, ProtocolError, IncompleteRead, ChunkedEncodingError) as e:
             logging.warning(f"Attempt {attempt + 1} failed with error: {e}")
             attempt += 1
             time.sleep(2)  # Wait 2 seconds before retrying
         except Exception as e:
-            logging.error(f"Failed to download attachment from {download_url} after {max_attempts} attempts: {e}")
+            logging.error(f"Failed to scan attachment from {download_url}: {e}")
             return None
+    logging.error(f"Failed to download attachment from {download_url} after {max_attempts} attempts")
     return None
 
-def setup_retry_session(retries=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504), allowed_exceptions=(ProtocolError, IncompleteRead)):
+def setup_retry_session(retries=3, backoff_factor=0.3, status_forcelist=(500, 502, 503, 504), allowed_exceptions=(ProtocolError, IncompleteRead), pool_size=10):
     """Set up a requests session with retry mechanism including ProtocolError."""
     session = requests.Session()
     retry = Retry(
@@ -125,51 +205,133 @@ def setup_retry_session(retries=3, backoff_factor=0.3, status_forcelist=(500, 50
         remove_headers_on_redirect=[],
         other=allowed_exceptions
     )
-    adapter = HTTPAdapter(max_retries=retry)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=pool_size, pool_maxsize=pool_size)
     session.mount('http://', adapter)
     session.mount('https://', adapter)
     return session
 
-def extract_text_from_node(node):
-    text = ''
-    if 'text' in node:
-        return node['text']
-    if 'content' in node:
-        for child in node['content']:
-            text += extract_text_from_node(child)
-    return text
+def api_get(url, **kwargs):
+    """GET url with the thread's session through the shared rate limiter."""
+    return api_request('GET', url, **kwargs)
+
+def api_post(url, **kwargs):
+    """POST to url with the thread's session through the shared rate limiter."""
+    return api_request('POST', url, **kwargs)
+
+def api_request(method, url, **kwargs):
+    """Send a request with the thread's session through the shared rate limiter, retrying throttled requests."""
+    for attempt in range(CONFIG['throttle_retries'] + 1):
+        RATE_LIMITER.acquire()
+        response = None
+        streamed = False
+        try:
+            response = get_session().request(method, url, **kwargs)
+            streamed = kwargs.get('stream', False) and response.status_code != 429
+        finally:
+            RATE_LIMITER.release(response, keep_slot=streamed)
+        if streamed:
+            release_slot_on_close(response)
+        if response.status_code != 429:
+            break
+        logging.warning(f"Request to {url} was throttled (attempt {attempt + 1} of {CONFIG['throttle_retries'] + 1}).")
+        response.close()
+    return response
+
+def release_slot_on_close(response):
+    """Keep a streamed response in flight in the rate limiter until it is closed, after its body has been read."""
+    close = response.close
+    released = []
+
+    def close_and_release():
+        try:
+            close()
+        finally:
+            if not released:
+                released.append(True)
+                RATE_LIMITER.release()
+
+    response.close = close_and_release
+
+def get_session():
+    """Return the calling thread's long-lived retry session, creating it on first use."""
+    session = getattr(THREAD_STATE, 'session', None)
+    if session is None:
+        session = setup_retry_session(pool_size=CONFIG['http_pool_size'])
+        THREAD_STATE.session = session
+    return session
 
 def append_to_csv(file_name, row):
     """Append a row to a CSV file."""
     try:
-        with open(file_name, mode='a', newline='') as file:
+        with CSV_LOCK, open(file_name, mode='a', newline='') as file:
             writer = csv.writer(file)
             writer.writerow(row)
     except Exception as e:
         logging.error(f"Failed to write to file '{file_name}': {e}")
 
+
 def check_patterns(text, issue_key, type, url):
-    false_positives = load_false_positives()  # Load false positives at the start or periodically refresh if needed
-    if issue_key in false_positives:
+    if issue_key in FALSE_POSITIVE_STORE:
         logging.info(f"Issue {issue_key} is marked as a false positive and will not be processed.")
         return
     
     if isinstance(text, bytes):
-        text = text.decode('utf-8')  # Ensure text is in string format
+        text = text.decode('utf-8', errors='replace')  # Ensure text is in string format
     if text:
-        for rule_name, pattern in REGEX_PATTERNS:
-            if re.search(pattern, text):
-                separator = "*" * 50  # Creates a line of asterisks
-                append_to_csv(FOUND_ISSUES_FILE, [issue_key, rule_name, type, url])
-                logging.warning(separator)
-                logging.warning(f"!!! ALERT: Found {rule_name} pattern in issue {issue_key} !!!")
-                logging.warning(separator)
+        inconclusive = []
+        report_matches(RULE_SET.scan(text, inconclusive=inconclusive), issue_key, type, url)
+        report_inconclusive(inconclusive, f"the {type} of issue {issue_key}")
+
+def report_inconclusive(rule_names, location):
+    """Log rules that timed out on a text, so no finding for them there is conclusive."""
+    if rule_names:
+        logging.warning(f"Rules {', '.join(sorted(set(rule_names)))} timed out on {location}, their result is inconclusive.")
+
+def report_matches(matches, issue_key, type, url):
+    """Record and log (rule_name, start, end) matches found in an issue."""
+    for rule_name, start, end in matches:
+        separator = "*" * 50  # Creates a line of asterisks
+        FINDINGS_SINK.add({'issue_key': issue_key, 'rule_name': rule_name, 'type': type, 'url': url, 'start': start, 'end': end})
+        logging.warning(separator)
+        logging.warning(f"!!! ALERT: Found {rule_name} pattern in issue {issue_key} (offset {start}-{end}) !!!")
+        logging.warning(separator)
                 
 def extract_text(content):
-    full_text = ''
-    for node in content['content']:
-        full_text += extract_text_from_node(node)
-    return full_text
+    """Extract the text of an Atlassian Document Format document.
+
+    Nodes are walked with an explicit stack, so deeply nested tables and lists
+    cannot hit the recursion limit, and text segments are joined once at the
+    end. Block nodes end with a newline and inline nodes other than text are
+    padded with spaces, so text from different nodes cannot merge into a false
+    match. Runs of text inside one block are joined as they are rendered.
+    """
+    if isinstance(content, str):
+        return content
+    segments = []
+    stack = [content]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, str):
+            segments.append(node)
+            continue
+        if not isinstance(node, dict):
+            continue
+        node_type = node.get('type')
+        attrs = node.get('attrs') or {}
+        if node_type == 'text':
+            segments.append(node.get('text', ''))
+        elif node_type == 'hardBreak':
+            segments.append('\n')
+        elif node_type in ('mention', 'status'):
+            segments.append(f" {attrs.get('text', '')} ")
+        elif node_type in ('inlineCard', 'blockCard', 'embedCard'):
+            segments.append(f" {attrs.get('url', '')} ")
+        children = node.get('content')
+        if children:
+            if node_type not in ADF_INLINE_NODES:
+                stack.append('\n')  # Popped after all of the block's children
+            stack.extend(reversed(children))
+    return ''.join(segments)
 
 if not os.path.exists(PROCESSED_PROJECTS_FILE):
     with open(PROCESSED_PROJECTS_FILE, mode='w', newline='') as file:
@@ -191,20 +353,6 @@ def delete_file(file_path):
         logging.error(f"Failed to delete file {file_path}: {e}")
 
 
-def load_false_positives(file_path='false_positive.txt'):
-    false_positives = set()
-    # Ensure the file exists, create it if it doesn't
-    if not os.path.exists(file_path):
-        with open(file_path, 'w') as file:
-            logging.info(f"{file_path} not found. Creating new file.")
-    try:
-        with open(file_path, 'r') as file:
-            for line in file:
-                false_positives.add(line.strip())
-    except Exception as e:
-        logging.error(f"Failed to read false positives from {file_path}: {e}")
-    return false_positives
-
 def load_project_keys(file_path='projects.txt'):
     try:
         with open(file_path, 'r') as file:
@@ -231,6 +379,92 @@ def load_processed_projects():
         logging.error(f"Error reading from file '{PROCESSED_PROJECTS_FILE}': {e}")
     return processed
 
+def load_watermarks():
+    """Load the per-project updated-since watermarks from file."""
+    try:
+        with open(WATERMARKS_FILE, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        logging.error(f"Error reading watermarks from '{WATERMARKS_FILE}': {e}")
+        return {}
+
+def save_watermark(project_key, updated):
+    """Record the latest scanned 'updated' timestamp of a project and persist all watermarks."""
+    with WATERMARKS_LOCK:
+        WATERMARKS[project_key] = updated
+        temp_path = WATERMARKS_FILE + '.tmp'
+        try:
+            with open(temp_path, 'w') as file:
+                json.dump(WATERMARKS, file, indent=2, sort_keys=True)
+            os.replace(temp_path, WATERMARKS_FILE)
+        except Exception as e:
+            logging.error(f"Failed to write watermarks to '{WATERMARKS_FILE}': {e}")
+
+def parse_jira_datetime(value):
+    """Parse a Jira timestamp such as 2024-01-31T10:15:00.000+0000."""
+    return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S.%f%z')
+
+def watermark_to_jql(watermark):
+    """Convert a stored watermark to a JQL date, moved back by the configured overlap."""
+    since = parse_jira_datetime(watermark).astimezone(timezone.utc) - timedelta(minutes=CONFIG['watermark_overlap_minutes'])
+    return since.strftime('%Y/%m/%d %H:%M')
+
+class AttachmentCache:
+    """Attachment scan results keyed by attachment id or content hash, persisted between runs with LRU eviction.
+
+    The cache is discarded when the regex rules change, since its results
+    would no longer match what a fresh scan reports.
+    """
+
+    def __init__(self, file_path, rules_fingerprint, max_entries):
+        self.file_path = file_path
+        self.rules_fingerprint = rules_fingerprint
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = Lock()
+        try:
+            with open(file_path, 'r') as file:
+                data = json.load(file)
+            if data.get('rules') == rules_fingerprint:
+                for key, matches in data.get('entries', []):
+                    self.entries[key] = [tuple(match) for match in matches]
+                logging.info(f"Loaded {len(self.entries)} cached attachment results from {file_path}")
+            else:
+                logging.info(f"Regex rules changed since {file_path} was written, starting with an empty attachment cache.")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logging.error(f"Error reading attachment cache from '{file_path}': {e}")
+
+    def get(self, key):
+        """Return the cached matches for key, or None when it is not cached."""
+        with self.lock:
+            matches = self.entries.get(key)
+            if matches is not None:
+                self.entries.move_to_end(key)
+            return matches
+
+    def put(self, key, matches):
+        with self.lock:
+            self.entries[key] = matches
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def save(self):
+        """Write the cache to disk, least recently used entries first."""
+        with self.lock:
+            data = {'rules': self.rules_fingerprint, 'entries': list(self.entries.items())}
+        temp_path = self.file_path + '.tmp'
+        try:
+            with open(temp_path, 'w') as file:
+                json.dump(data, file)
+            os.replace(temp_path, self.file_path)
+        except Exception as e:
+            logging.error(f"Failed to write attachment cache to '{self.file_path}': {e}")
+
 def load_regex_patterns(file_path):
     """Load regex patterns from file."""
     patterns = []
@@ -247,7 +481,26 @@ def load_regex_patterns(file_path):
 
 
 PROCESSED_PROJECTS = load_processed_projects()
+WATERMARKS = load_watermarks()
 REGEX_PATTERNS = load_regex_patterns(os.path.join(os.getcwd(), REGEX_PATTERNS_FILE))
+RULE_SET = RuleSet(REGEX_PATTERNS, timeout=CONFIG['rule_timeout_seconds'], quarantine_after=CONFIG['rule_quarantine_after'],
+                   backend=CONFIG['regex_backend'])
+FALSE_POSITIVE_STORE = FalsePositiveStore(FALSE_POSITIVES, LEGACY_FALSE_POSITIVES)
+RATE_LIMITER = RateLimiter(CONFIG['requests_per_second'], CONFIG['max_requests_per_second'], CONFIG['max_concurrent_requests'])
+FINDINGS_SINK = FindingsSink(
+    FOUND_ISSUES_FILE,
+    columns=[('issue_key', 'ISSUE_KEY'), ('rule_name', 'RULE_NAME'), ('type', 'TYPE'), ('url', 'URL')],
+    output_format=CONFIG['output_format'],
+    tool_name='jira-scanner',
+    location_key='url'
+)
+atexit.register(FINDINGS_SINK.close)
+ATTACHMENT_CACHE = AttachmentCache(
+    ATTACHMENT_CACHE_FILE,
+    rules_fingerprint=hashlib.sha256(json.dumps(REGEX_PATTERNS).encode()).hexdigest(),
+    max_entries=CONFIG['attachment_cache_entries']
+)
+atexit.register(ATTACHMENT_CACHE.save)
 
 ############################
 # API Interaction Functions
@@ -257,7 +510,7 @@ def fetch_all_projects():
     """Fetch all projects from JIRA using REST API."""
     url = f"{CONFIG['base_url']}/rest/api/3/project"
     try:
-        response = requests.get(url, auth=AUTH, headers=HEADERS)
+        response = api_get(url, auth=AUTH, headers=HEADERS)
         response.raise_for_status()
         projects = response.json()
         return [project['key'] for project in projects]
@@ -265,41 +518,109 @@ def fetch_all_projects():
         logging.error(f"Failed to fetch projects from JIRA: {e}")
         return []
 
-def process_attachments(issue_key):
-    """Fetch and process attachments from a Jira issue."""
-    url = f"{CONFIG['base_url']}/rest/api/3/issue/{issue_key}"
-    # Modify headers to disable automatic gzip compression
-    custom_headers = {**HEADERS, 'Accept-Encoding': 'identity', 'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'}
-    response = None  # Initialize response outside try to make it accessible in except
-
-    try:
-        response = requests.get(url, auth=AUTH, headers=custom_headers)
-        response.raise_for_status()  # Ensure the request was successful
-        issue_details = response.json()
-        attachments = issue_details['fields'].get('attachment', [])
-
-        for attachment in attachments:
-            if attachment['filename'].endswith(('csv', 'txt', 'json', 'yaml', 'yml', 'md', 'conf', 'ini', 'sh', 'bat', 'ps1', 'log')):
-                download_url = attachment['content']
-                file_content = download_attachment(download_url)
-                if file_content:
-                    try:
-                        check_patterns(file_content, issue_key, 'attachment', f"{CONFIG['base_url']}/browse/{issue_key}")
-                    except Exception as e:
-                        logging.error(f"Failed to check patterns for attachment in issue {issue_key}: {e}")
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Failed to retrieve issue details for {issue_key}: {e}")
-        if response:
-            logging.error(f"Response status code: {response.status_code}")
-            logging.error(f"Response content: {response.content[:500]}")  # Log part of the content to inspect it
-        else:
-            logging.error("No response received due to network or connection error.")
+def fetch_issue_page(jql_query, start_at=0, next_page_token=None):
+    """Fetch one page of search results from the token-based or the legacy startAt search endpoint."""
+    params = {'jql': jql_query, 'maxResults': CONFIG['search_page_size'], 'fields': ISSUE_FIELDS if CONFIG['hydrate_issues'] else '*navigable'}
+    if CONFIG['hydrate_issues'] and not CONFIG['bulk_changelog']:
+        params['expand'] = 'changelog'
+    if CONFIG['search_endpoint'] == 'jql':
+        url = f"{CONFIG['base_url']}/rest/api/3/search/jql"
+        if next_page_token:
+            params['nextPageToken'] = next_page_token
+    else:
+        url = f"{CONFIG['base_url']}/rest/api/3/search"
+        params['startAt'] = start_at
+    response = api_get(url, auth=AUTH, headers=HEADERS, params=params)
+    response.raise_for_status()
+    return response.json()
+
+def iter_issue_pages(jql_query):
+    """Yield search result pages, fetching the next page in the background while the current one is processed."""
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(fetch_issue_page, jql_query)
+        start_at = 0
+        while future is not None:
+            issues_data = future.result()
+            issues_list = issues_data.get('issues', [])
+            start_at += len(issues_list)
+            if CONFIG['search_endpoint'] == 'jql':
+                next_page_token = issues_data.get('nextPageToken')
+                has_more = bool(next_page_token) and not issues_data.get('isLast', False)
+                future = executor.submit(fetch_issue_page, jql_query, next_page_token=next_page_token) if has_more else None
+            else:
+                has_more = bool(issues_list) and start_at < issues_data.get('total', 0)
+                future = executor.submit(fetch_issue_page, jql_query, start_at=start_at) if has_more else None
+            yield issues_data
+
+def process_attachments(issue_key, attachments=None):
+    """Process attachments of a Jira issue, fetching their metadata only when the search did not include it.
+
+    Raises once every attachment has been tried if any of them, or the
+    metadata, could not be fetched and scanned.
+    """
+    if attachments is None:
+        url = f"{CONFIG['base_url']}/rest/api/3/issue/{issue_key}?fields=attachment"
+        # Modify headers to disable automatic gzip compression
+        custom_headers = {**HEADERS, 'Accept-Encoding': 'identity', 'Accept-Encoding': 'gzip, deflate', 'Connection': 'keep-alive'}
+        response = None  # Initialize response outside try to make it accessible in except
 
-def process_comments(issue_key):
-    """Fetch and process all comments for a given issue."""
-    comments_response = requests.get(f"{CONFIG['base_url']}/rest/api/3/issue/{issue_key}/comment", auth=AUTH, headers=HEADERS)
-    comments = comments_response.json()
-    for comment in comments.get('comments', []):
+        try:
+            response = api_get(url, auth=AUTH, headers=custom_headers)
+            response.raise_for_status()  # Ensure the request was successful
+            issue_details = response.json()
+            attachments = issue_details['fields'].get('attachment', [])
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Failed to retrieve issue details for {issue_key}: {e}")
+            if response:
+                logging.error(f"Response status code: {response.status_code}")
+                logging.error(f"Response content: {response.content[:500]}")  # Log part of the content to inspect it
+            else:
+                logging.error("No response received due to network or connection error.")
+            raise
+
+    failed = 0
+    for attachment in attachments:
+        if attachment['filename'].endswith(('csv', 'txt', 'json', 'yaml', 'yml', 'md', 'conf', 'ini', 'sh', 'bat', 'ps1', 'log')):
+            download_url = attachment['content']
+            cache_key = f"id:{attachment['id']}"
+            matches = ATTACHMENT_CACHE.get(cache_key)
+            if matches is None:
+                inconclusive = []
+                matches = scan_attachment(download_url, attachment.get('size'), inconclusive)
+                report_inconclusive(inconclusive, f"attachment {attachment['id']} of issue {issue_key}")
+                if matches is None:
+                    failed += 1
+                elif not inconclusive:
+                    ATTACHMENT_CACHE.put(cache_key, matches)
+            else:
+                logging.info(f"Attachment {attachment['id']} of issue {issue_key} was scanned before, reusing its result.")
+            if matches:
+                report_matches(matches, issue_key, 'attachment', f"{CONFIG['base_url']}/browse/{issue_key}")
+    if failed:
+        raise RuntimeError(f"{failed} attachments of issue {issue_key} could not be scanned")
+
+def fetch_comments(issue_key):
+    """Fetch every comment of an issue, following pagination."""
+    comments = []
+    start_at = 0
+    while True:
+        url = f"{CONFIG['base_url']}/rest/api/3/issue/{issue_key}/comment?startAt={start_at}&maxResults=100"
+        response = api_get(url, auth=AUTH, headers=HEADERS)
+        response.raise_for_status()
+        data = response.json()
+        page = data.get('comments', [])
+        comments.extend(page)
+        start_at += len(page)
+        if not page or start_at >= data.get('total', 0):
+            return comments
+
+def process_comments(issue_key, comment_field=None):
+    """Process all comments for a given issue, fetching them only when the search did not embed all of them."""
+    if comment_field is not None and comment_field.get('total', 0) <= len(comment_field.get('comments', [])):
+        comments = comment_field.get('comments', [])
+    else:
+        comments = fetch_comments(issue_key)
+    for comment in comments:
         comment_content = comment.get('body', {})
         check_patterns(extract_text(comment_content), issue_key, "comment", f"{CONFIG['base_url']}/browse/{issue_key}")
 
@@ -309,21 +630,68 @@ def process_descriptions(issue_key, description):
         check_patterns(extract_text(description), issue_key, "description", f"{CONFIG['base_url']}/browse/{issue_key}")
 
 
-def process_history(issue_key):
-    """Process changelog history for descriptions of a given issue."""
-    url = f"{CONFIG['base_url']}/rest/api/3/issue/{issue_key}/changelog"
-
-    response = requests.get(url, auth=AUTH, headers=HEADERS)
-    if response.status_code == 200:
-        changes = response.json()
-        for history_item in changes['values']:
-            for item in history_item['items']:
-                if item['field'] == 'description':
-                    old_description = item.get('fromString', '')
-                    check_patterns(old_description, issue_key, "description history", f"{CONFIG['base_url']}/browse/{issue_key}")
+def fetch_changelog(issue_key):
+    """Fetch every changelog entry of an issue, following pagination."""
+    histories = []
+    start_at = 0
+    while True:
+        url = f"{CONFIG['base_url']}/rest/api/3/issue/{issue_key}/changelog?startAt={start_at}&maxResults=100"
+        response = api_get(url, auth=AUTH, headers=HEADERS)
+        response.raise_for_status()
+        data = response.json()
+        page = data.get('values', [])
+        histories.extend(page)
+        start_at += len(page)
+        if not page or data.get('isLast', start_at >= data.get('total', 0)):
+            return histories
+
+def fetch_description_changelogs(issue_ids):
+    """Fetch the description changes of many issues with the bulk changelog endpoint, following pagination.
+
+    Returns a dict of issue id to its change histories.
+    """
+    url = f"{CONFIG['base_url']}/rest/api/3/changelog/bulkfetch"
+    body = {'issueIdsOrKeys': issue_ids, 'fieldIds': ['description'], 'maxResults': 1000}
+    changelogs = {}
+    while True:
+        response = api_post(url, auth=AUTH, headers=HEADERS, json=body)
+        response.raise_for_status()
+        data = response.json()
+        for issue_changelog in data.get('issueChangeLogs', []):
+            changelogs.setdefault(issue_changelog['issueId'], []).extend(issue_changelog.get('changeHistories', []))
+        next_page_token = data.get('nextPageToken')
+        if not next_page_token:
+            return changelogs
+        body['nextPageToken'] = next_page_token
+
+def scan_description_history(issue_key, histories):
+    """Check every distinct earlier description of an issue once."""
+    old_descriptions = set()
+    for history_item in histories:
+        for item in history_item['items']:
+            if item['field'] == 'description' and item.get('fromString'):
+                old_descriptions.add(item['fromString'])
+    for old_description in old_descriptions:
+        check_patterns(old_description, issue_key, "description history", f"{CONFIG['base_url']}/browse/{issue_key}")
+
+def process_changelog_batch(issues):
+    """Scan the description history of a page of issues, fetched with the bulk changelog endpoint.
+
+    A failed fetch is raised, so the project is neither marked processed nor
+    given a new watermark.
+    """
+    keys_by_id = {issue['id']: issue['key'] for issue in issues}
+    changelogs = fetch_description_changelogs(list(keys_by_id))
+    for issue_id, histories in changelogs.items():
+        scan_description_history(keys_by_id.get(issue_id, issue_id), histories)
+
+def process_history(issue_key, changelog=None):
+    """Process changelog history for descriptions of a given issue, fetching it only when the search truncated it."""
+    if changelog is not None and changelog.get('total', 0) <= len(changelog.get('histories', [])):
+        histories = changelog.get('histories', [])
     else:
-        logging.error(f"Failed to retrieve changelog: {response.status_code}")
-        logging.error(response.text)
+        histories = fetch_changelog(issue_key)
+    scan_description_history(issue_key, histories)
 
 ##############################
 # Project Management Functions
@@ -358,96 +726,179 @@ def is_project_running(project_key):
 # Core Processing Functions
 ###########################
 
-def worker(project_queue):
+class PendingIssues:
+    """Count of queued but unfinished issues per project, so a project is only marked processed once all its issues are scanned.
+
+    Tasks that failed are remembered until the project has been waited for.
+    """
+
+    def __init__(self):
+        self.counts = {}
+        self.failed = set()
+        self.condition = Condition()
+
+    def add(self, project_key):
+        with self.condition:
+            self.counts[project_key] = self.counts.get(project_key, 0) + 1
+
+    def done(self, project_key, failed=False):
+        with self.condition:
+            if failed:
+                self.failed.add(project_key)
+            self.counts[project_key] -= 1
+            if self.counts[project_key] == 0:
+                del self.counts[project_key]
+                self.condition.notify_all()
+
+    def wait(self, project_key):
+        """Wait for every queued task of a project and return whether they all succeeded."""
+        with self.condition:
+            self.condition.wait_for(lambda: project_key not in self.counts)
+            failed = project_key in self.failed
+            self.failed.discard(project_key)
+            return not failed
+
+
+PENDING_ISSUES = PendingIssues()
+
+def worker(project_queue, issue_queue):
+    """Feed the issues of each project into the shared issue queue and mark the project processed once they are all scanned."""
     while not project_queue.empty():
         try:
             project_key = project_queue.get()
             logging.info(f"Processing project_key: {project_key}")
             if project_key not in PROCESSED_PROJECTS and not is_project_running(project_key):
                 add_to_running_projects(project_key)
-                process_issues(project_key)
-                append_to_csv(PROCESSED_PROJECTS_FILE, [project_key])
-                PROCESSED_PROJECTS.add(project_key)
+                completed, latest_updated = process_issues(project_key, issue_queue)
+                completed = PENDING_ISSUES.wait(project_key) and completed
+                if completed:
+                    logging.info(f"Finished processing all issues for project {project_key}")
+                    if latest_updated:
+                        save_watermark(project_key, latest_updated)
+                    append_to_csv(PROCESSED_PROJECTS_FILE, [project_key])
+                    PROCESSED_PROJECTS.add(project_key)
+                else:
+                    logging.error(f"Not all issues of project {project_key} could be fetched and scanned, it is not marked as processed.")
                 remove_from_running_projects(project_key)
         except Exception as e:
             logging.error(f"Error processing project {project_key}: {e}")
         finally:
             project_queue.task_done()
-            
-def process_issues(project_key):
-    start_at = 0
-    max_results = 50
-    total_issues_count = 0  # This will store the total count of issues for logging
-    
-    jql_query = f"project=\'{project_key}\'"
-    
-    issue_counter = 0
-    # First, get the total count of issues to be processed
-    count_url = f"{CONFIG['base_url']}/rest/api/3/search?jql={jql_query}&maxResults=0"
-    count_response = requests.get(count_url, auth=AUTH, headers=HEADERS)
-    total_issues = count_response.json().get('total', 0)
-
-    # Initial fetch to determine the total number of issues to process
-    try:
-        issues_url = f"{CONFIG['base_url']}/rest/api/3/search?jql={jql_query}&startAt={start_at}&maxResults={max_results}"
-        initial_response = requests.get(issues_url, auth=AUTH, headers=HEADERS)
-        initial_response.raise_for_status()
-        total_issues_count = initial_response.json().get('total', 0)
-        logging.info(f"Total issues to be processed for project {project_key}: {total_issues_count}")
-    except requests.exceptions.RequestException as e:
-        logging.error(f"Failed to fetch initial issue data for project {project_key}: {e}")
-        return  # Exit the function if initial fetch fails
 
-    # Process all issues
+def issue_worker(issue_queue):
+    """Run issue and changelog tasks from the shared issue queue until a None sentinel arrives."""
     while True:
+        item = issue_queue.get()
+        if item is None:
+            issue_queue.task_done()
+            return
+        project_key, description, handler, args = item
+        failed = False
         try:
-            issues_url = f"{CONFIG['base_url']}/rest/api/3/search?jql=project=\'{project_key}\'&startAt={start_at}&maxResults={max_results}"
-            issues_response = requests.get(issues_url, auth=AUTH, headers=HEADERS)
-            issues_response.raise_for_status()
-            issues_data = issues_response.json()
-            issues_list = issues_data.get('issues', [])
-            if not issues_list:
-                break  # Exit the loop if no more issues are found
+            logging.info(f"Processing {description}")
+            handler(*args)
+        except Exception as e:
+            logging.error(f"Error processing {description}: {e}")
+            failed = True
+        finally:
+            PENDING_ISSUES.done(project_key, failed)
+            issue_queue.task_done()
+
+def process_issue(issue):
+    """Scan the description, comments, attachments and description history of one issue.
+
+    Every part is tried; if any of them failed, an error naming them is raised
+    afterwards so the issue worker reports the failure to PENDING_ISSUES and
+    the project keeps its watermark.
+    """
+    issue_key = issue['key']
+    failed = []
+    try:
+        description = issue['fields'].get('description', {})
+        process_descriptions(issue_key, description)
+    except Exception as e:
+        logging.error(f"Failed to process description for issue {issue_key}: {e}")
+        failed.append('description')
 
-            for issue in issues_list:
-                issue_key = issue['key']
-                issue_counter += 1
-                logging.info(f"Processing issue {issue_key} ({issue_counter} of {total_issues})")
-                
-                try:
-                    description = issue['fields'].get('description', {})
-                    process_descriptions(issue_key, description)
-                except Exception as e:
-                    logging.error(f"Failed to process description for issue {issue_key}: {e}")
+    fields = issue['fields'] if CONFIG['hydrate_issues'] else {}
 
-                try:
-                    process_comments(issue_key)
-                except Exception as e:
-                    logging.error(f"Failed to process comments for issue {issue_key}: {e}")
+    try:
+        process_comments(issue_key, fields.get('comment'))
+    except Exception as e:
+        logging.error(f"Failed to process comments for issue {issue_key}: {e}")
+        failed.append('comments')
 
-                try:
-                    process_attachments(issue_key)
-                except Exception as e:
-                    logging.error(f"Failed to process attachments for issue {issue_key}: {e}")
+    try:
+        process_attachments(issue_key, fields.get('attachment'))
+    except Exception as e:
+        logging.error(f"Failed to process attachments for issue {issue_key}: {e}")
+        failed.append('attachments')
 
-                try:
-                    process_history(issue_key)
-                except Exception as e:
-                    logging.error(f"Failed to process history for issue {issue_key}: {e}")
+    if not CONFIG['bulk_changelog']:  # Otherwise description history is scanned per page by process_changelog_batch
+        try:
+            process_history(issue_key, issue.get('changelog') if CONFIG['hydrate_issues'] else None)
+        except Exception as e:
+            logging.error(f"Failed to process history for issue {issue_key}: {e}")
+            failed.append('history')
 
-            start_at += len(issues_list)  # Prepare for the next batch of issues
+    if failed:
+        raise RuntimeError(f"the {', '.join(failed)} of issue {issue_key} could not be scanned")
 
-        except requests.exceptions.RequestException as e:
-            logging.error(f"Error fetching or processing issues for project {project_key}: {e}")
-            # Consider whether to break or continue here depending on how critical the failure is
+def process_issues(project_key, issue_queue):
+    """Page through the issues of a project and queue them for the issue workers.
 
-    logging.info(f"Finished processing all issues for project {project_key}")
+    In incremental mode only issues updated since the project's watermark are
+    searched. Returns (completed, latest_updated): whether every page was
+    fetched, and the latest 'updated' timestamp seen.
+    """
+    jql_query = f"project=\'{project_key}\'"
+    if CONFIG['incremental'] and project_key in WATERMARKS:
+        jql_query += f" AND updated >= \'{watermark_to_jql(WATERMARKS[project_key])}\'"
+        logging.info(f"Incremental scan of project {project_key}: {jql_query}")
+    latest_updated = None
+    issue_counter = 0
+    total_issues = '?'  # The token-based search endpoint does not report a total
+
+    try:
+        for issues_data in iter_issue_pages(jql_query):
+            total_issues = issues_data.get('total', total_issues)
+            page_issues = []
+            for issue in issues_data.get('issues', []):
+                issue_key = issue['key']
+                issue_counter += 1
+                updated = issue['fields'].get('updated')
+                if updated and (latest_updated is None or parse_jira_datetime(updated) > parse_jira_datetime(latest_updated)):
+                    latest_updated = updated
+                if issue_key in FALSE_POSITIVE_STORE:
+                    logging.info(f"Issue {issue_key} is marked as a false positive and will not be processed.")
+                    continue
+                page_issues.append(issue)
+                PENDING_ISSUES.add(project_key)
+                # Blocks while the issue workers are behind
+                issue_queue.put((project_key, f"issue {issue_key} ({issue_counter} of {total_issues})", process_issue, (issue,)))
+            if CONFIG['bulk_changelog'] and page_issues:
+                PENDING_ISSUES.add(project_key)
+                issue_queue.put((project_key, f"description history of {len(page_issues)} issues in {project_key}", process_changelog_batch, (page_issues,)))
+    except requests.exceptions.RequestException as e:
+        logging.error(f"Error fetching issues for project {project_key}: {e}")
+        return False, latest_updated
+
+    logging.info(f"Queued all {issue_counter} issues for project {project_key}")
+    return True, latest_updated
     
     
-def process_projects(thread_count, project_keys=None):
-    """Process a list of projects in parallel using threading."""
+def process_projects(thread_count, project_keys=None, project_thread_count=None):
+    """Process a list of projects with a shared pool of issue workers.
+
+    A few project threads page through search results and feed a bounded
+    queue of issues, which thread_count issue workers drain, so a single
+    large project can use all of the configured concurrency.
+    """
 
     project_queue = Queue()
+    issue_queue = Queue(maxsize=thread_count * CONFIG['issue_queue_per_worker'])
+    if project_thread_count is None:
+        project_thread_count = CONFIG['project_threads']
 
     # Determine which projects to process
     if project_keys is None or project_keys == []:
@@ -457,13 +908,24 @@ def process_projects(thread_count, project_keys=None):
     for project_key in project_keys:
         project_queue.put(project_key)
 
-    threads = []
+    issue_threads = []
     for _ in range(thread_count):
-        thread = Thread(target=worker, args=(project_queue,))
-        threads.append(thread)
+        thread = Thread(target=issue_worker, args=(issue_queue,))
+        issue_threads.append(thread)
+        thread.start()
+
+    project_threads = []
+    for _ in range(min(project_thread_count, len(project_keys)) or 1):
+        thread = Thread(target=worker, args=(project_queue, issue_queue))
+        project_threads.append(thread)
         thread.start()
 
-    for thread in threads:
+    for thread in project_threads:
+        thread.join()
+
+    for _ in issue_threads:
+        issue_queue.put(None)
+    for thread in issue_threads:
         thread.join()
 
 # Example usage
@@ -476,8 +938,11 @@ if __name__ == '__main__':
     delete_file(RUNNING_PROJECTS_FILE)
     
     project_keys = load_project_keys()  
-    thread_count = 10  # Adjust thread count as needed
+    thread_count = 10  # Number of issue workers, adjust as needed
     process_projects(thread_count, project_keys)
+    FINDINGS_SINK.close()
+    ATTACHMENT_CACHE.save()
+    RULE_SET.report()
     
     delete_file(PROCESSED_PROJECTS_FILE)
     delete_file(RUNNING_PROJECTS_FILE)
@@ -0,0 +1,832 @@
+"""Code shared by the Jira and Bitbucket scanners.
+
+The rule engine and file scanning, findings output, API rate limiting and
+false positive lists. Importing this module has no side effects, so the
+Bitbucket scanner's scan processes can import it without repeating the
+scanner's own setup.
+"""
+import os
+import csv
+import json
+import mmap
+import time
+import logging
+import regex as re
+import re as stdlib_re
+from queue import Queue, Empty
+from threading import Condition, Lock, Thread
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+try:
+    import re2  # Optional linear-time engine: pip install google-re2
+except ImportError:
+    re2 = None
+
+########################
+# Rule Engine
+########################
+
+MIN_KEYWORD_LENGTH = 3
+INLINE_FLAGS = re.compile(r'\(\?([a-zA-Z]*)(?:-([a-zA-Z]*))?\)')
+BRACE_QUANTIFIER = re.compile(r'\{(\d*)(?:,\d*)?\}')
+# Escapes that only have a meaning on Unicode text
+UNICODE_ESCAPE = re.compile(r'\\[pPNuUX]')
+# Escapes whose argument is part of one atom: properties, named characters, hex and octal codes, backreferences
+ESCAPE_ATOM = re.compile(r'\\(?:[pPN]\{[^}]*\}|[pP]\w|x\{[0-9a-fA-F]*\}|x[0-9a-fA-F]{0,2}|u[0-9a-fA-F]{0,4}|U[0-9a-fA-F]{0,8}'
+                         r'|0[0-7]{0,2}|[1-7][0-7]{2}|[1-9][0-9]?|g<[^>]*>|.)', re.DOTALL)
+
+def load_regex_backends():
+    """Return the compile function of every available regex backend, by name."""
+    backends = {'regex': re.compile, 're': stdlib_re.compile}
+    if re2 is not None:
+        if hasattr(re2, 'Options'):
+            options = re2.Options()
+            options.log_errors = False  # Unsupported patterns fall back quietly
+            backends['re2'] = lambda pattern: re2.compile(pattern, options)
+        else:
+            backends['re2'] = re2.compile
+    return backends
+
+REGEX_BACKENDS = load_regex_backends()
+
+def find_class_end(pattern, start):
+    """Return the index just past the character class opening at pattern[start]."""
+    i = start + 1
+    if pattern[i:i + 1] == '^':
+        i += 1
+    if pattern[i:i + 1] == ']':
+        i += 1
+    while i < len(pattern):
+        if pattern[i] == '\\':
+            i += 2
+        elif pattern[i] == ']':
+            return i + 1
+        else:
+            i += 1
+    return len(pattern)
+
+def find_group_end(pattern, start):
+    """Return the index just past the group opening at pattern[start]."""
+    depth = 0
+    i = start
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            i += 2
+            continue
+        if char == '[':
+            i = find_class_end(pattern, i)
+            continue
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+            if depth == 0:
+                return i + 1
+        i += 1
+    return len(pattern)
+
+def extract_required_literal(pattern):
+    """Return (literal, ignore_case) for the longest literal every match of pattern must contain, or None."""
+    runs = []
+    run = ''
+    ignore_case = False
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        brace = BRACE_QUANTIFIER.match(pattern, i) if char == '{' else None
+        if char in '*?+' or brace:
+            # A quantified character is only required when the quantifier demands at least one repetition
+            minimum = int(brace.group(1) or 0) if brace else (1 if char == '+' else 0)
+            runs.append((run if minimum else run[:-1], ignore_case))
+            run = ''
+            i = brace.end() if brace else i + 1
+            if pattern[i:i + 1] in ('?', '+'):
+                i += 1  # Lazy or possessive modifier
+        elif char == '|':
+            return None  # Top-level alternation, no single literal is required
+        elif char == '{':
+            return None  # Not a repeat count: a fuzzy constraint such as {e<=1}, which lets the literal itself vary
+        elif char == '\\':
+            escaped = pattern[i + 1:i + 2]
+            if escaped and not escaped.isalnum():
+                run += escaped
+                i += 2
+            else:
+                runs.append((run, ignore_case))
+                run = ''
+                atom = ESCAPE_ATOM.match(pattern, i)
+                i = atom.end() if atom else i + 2
+        elif char == '[':
+            runs.append((run, ignore_case))
+            run = ''
+            i = find_class_end(pattern, i)
+        elif char == '(':
+            runs.append((run, ignore_case))
+            run = ''
+            flags = INLINE_FLAGS.match(pattern, i)
+            if flags:
+                enabled, disabled = flags.group(1), flags.group(2) or ''
+                if 'x' in enabled:
+                    return None  # Verbose patterns are not parsed for literals
+                if 'i' in enabled:
+                    ignore_case = True
+                if 'i' in disabled:
+                    ignore_case = False
+                i = flags.end()
+            else:
+                i = find_group_end(pattern, i)
+        elif char in '.^$':
+            runs.append((run, ignore_case))
+            run = ''
+            i += 1
+        else:
+            run += char
+            i += 1
+    runs.append((run, ignore_case))
+    literal, literal_ignore_case = max(runs, key=lambda item: len(item[0]))
+    if len(literal) < MIN_KEYWORD_LENGTH:
+        return None
+    return literal, literal_ignore_case
+
+class RuleSet:
+    """Regex rules compiled once and applied together to each scanned text.
+
+    Rules that contain a required literal are only run when the text contains
+    that literal; each keyword is looked for at most once per text, with a
+    plain substring search unless it ignores case. Rules without a usable
+    literal always run. Rules run one after another rather than as one
+    alternation: each rule's leading literal lets the engine skip straight to
+    candidate positions, a combined pattern would hide matches of different
+    rules that overlap, and every rule keeps its own time budget. With binary
+    set, rules are compiled as bytes patterns
+    and scan raw bytes (or an mmap) without decoding them; rules that need
+    Unicode (non-ASCII characters, \\p{..} and similar escapes, or any rule
+    that is not valid as a bytes pattern) run with the regex module on the
+    text decoded as UTF-8 instead. Either way, offsets are byte offsets.
+
+    Rules are compiled with the given backend ('regex', 're' or 're2' when a
+    binding is installed); a rule the backend cannot compile falls back to
+    the regex module. Rules on the regex backend get timeout seconds per
+    text, and RE2 runs in linear time; 're' cannot be interrupted, so it is
+    replaced by 'regex' when a timeout is set. A rule that runs out of time
+    is inconclusive for that text, and after quarantine_after timeouts it is
+    quarantined: no longer run for the rest of the run.
+    """
+
+    def __init__(self, patterns, binary=False, timeout=None, quarantine_after=3, backend='regex'):
+        if backend not in REGEX_BACKENDS:
+            logging.warning(f"Regex backend '{backend}' is not available, using 'regex' instead.")
+            backend = 'regex'
+        if backend == 're' and timeout:
+            logging.warning("The 're' backend cannot stop a rule that runs out of time, using 'regex' to keep the rule timeout.")
+            backend = 'regex'
+        self.binary = binary
+        self.timeout = timeout
+        self.quarantine_after = quarantine_after
+        self.timeouts = {}  # Rule name -> timeouts during the run
+        self.new_timeouts = {}  # Timeouts not yet handed out by take_new_timeouts
+        self.quarantined = frozenset()  # Replaced rather than changed, so it can be read without the lock
+        self.lock = Lock()
+        self.newline = self.as_pattern('\n')
+        self.rules = []
+        self.backends = {}  # Rule name -> backend it was compiled with
+        for rule_name, pattern in patterns:
+            decoded = binary and (not pattern.isascii() or UNICODE_ESCAPE.search(pattern) is not None)
+            compiled, name, error = (None, None, None) if decoded else self.compile_rule(rule_name, self.as_pattern(pattern), backend)
+            if compiled is None and binary:
+                decoded = True
+                compiled, name, error = self.compile_rule(rule_name, pattern, 'regex')
+            if compiled is None:
+                logging.error(f"Invalid regex for rule {rule_name}, skipping it: {error}")
+                continue
+            if decoded:
+                logging.info(f"Rule {rule_name} needs Unicode, it runs on decoded text.")
+            keyword = extract_required_literal(pattern)
+            if keyword and decoded and keyword[1] and not keyword[0].isascii():
+                keyword = None  # Bytes patterns only fold the case of ASCII letters
+            if keyword:
+                keyword = (self.as_pattern(keyword[0]), keyword[1])
+            options = {'timeout': timeout} if name == 'regex' else {}  # Only the regex module supports a timeout
+            self.rules.append((rule_name, compiled, keyword, options, decoded))
+            self.backends[rule_name] = name
+
+        self.keywords = {keyword for _, _, keyword, _, _ in self.rules if keyword}
+        self.ignore_case_keywords = {(literal, ignore_case): re.compile(re.escape(literal), re.IGNORECASE)
+                                     for literal, ignore_case in self.keywords if ignore_case}
+        backend_counts = ', '.join(f"{list(self.backends.values()).count(name)} with {name}" for name in sorted(set(self.backends.values())))
+        logging.info(f"Compiled {len(self.rules)} of {len(patterns)} regex rules ({backend_counts}), {len(self.keywords)} keywords for prefiltering.")
+
+    def compile_rule(self, rule_name, pattern, backend):
+        """Return (compiled, backend, error), falling back to the regex module when backend can't compile pattern."""
+        error = None
+        for name in dict.fromkeys([backend, 'regex']):
+            try:
+                return REGEX_BACKENDS[name](pattern), name, None
+            except Exception as e:
+                error = e
+                if name != 'regex':
+                    logging.info(f"Rule {rule_name} is not supported by the {name} backend ({e}), falling back to regex.")
+        return None, None, error
+
+    def as_pattern(self, text):
+        return text.encode('utf-8') if self.binary else text
+
+    def contains_keyword(self, text, keyword):
+        if keyword in self.ignore_case_keywords:
+            return self.ignore_case_keywords[keyword].search(text) is not None
+        return text.find(keyword[0]) != -1
+
+    def scan(self, text, skip=(), exclude_line=None, inconclusive=None):
+        """Return (rule_name, start, end) for the first match of every rule found in text, ignoring rules named in skip.
+
+        Matches on a line that contains exclude_line are passed over. Rules
+        that time out are appended to the inconclusive list when one is given.
+        """
+        keywords = {}  # Keyword -> whether text contains it, looked up when a rule first needs it
+        matches = []
+        text_bytes = None  # Copy of an mmap for backends that only accept bytes
+        decoded_text = None  # Text for the rules that need Unicode, invalid UTF-8 kept as surrogates
+        for rule_name, compiled, keyword, options, decoded in self.rules:
+            if rule_name in skip or rule_name in self.quarantined:
+                continue
+            if keyword:
+                if keyword not in keywords:
+                    keywords[keyword] = self.contains_keyword(text, keyword)
+                if not keywords[keyword]:
+                    continue
+            if decoded and decoded_text is None:
+                decoded_text = bytes(text).decode('utf-8', errors='surrogateescape')
+            try:
+                try:
+                    match = self.first_match(compiled, text, options, exclude_line, decoded_text if decoded else None)
+                except TypeError:
+                    if isinstance(text, (bytes, str)):
+                        raise
+                    # Some RE2 bindings don't accept an mmap
+                    if text_bytes is None:
+                        text_bytes = bytes(text)
+                    match = self.first_match(compiled, text_bytes, options, exclude_line)
+            except TimeoutError:
+                self.record_timeout(rule_name)
+                if inconclusive is not None:
+                    inconclusive.append(rule_name)
+                continue
+            except Exception as e:
+                logging.warning(f"Rule {rule_name} failed on the {self.backends[rule_name]} backend, its result is inconclusive: {e}")
+                if inconclusive is not None:
+                    inconclusive.append(rule_name)
+                continue
+            if match:
+                matches.append((rule_name, *match))
+        return matches
+
+    def first_match(self, compiled, text, options, exclude_line, decoded_text=None):
+        """Return (start, end) of the first match in text that is not on a line containing exclude_line, or None.
+
+        With decoded_text, the rule runs on that decoding of text and its
+        offsets are converted back to byte offsets in text.
+        """
+        for match in compiled.finditer(text if decoded_text is None else decoded_text, **options):
+            start, end = match.span()
+            if decoded_text is not None:
+                start = len(decoded_text[:start].encode('utf-8', errors='surrogateescape'))
+                end = start + len(match.group().encode('utf-8', errors='surrogateescape'))
+            if exclude_line is None or exclude_line not in self.line_of(text, start, end):
+                return start, end
+        return None
+
+    def record_timeout(self, rule_name, count=1):
+        """Count timeouts of a rule and quarantine it once it reaches quarantine_after."""
+        with self.lock:
+            self.timeouts[rule_name] = self.timeouts.get(rule_name, 0) + count
+            self.new_timeouts[rule_name] = self.new_timeouts.get(rule_name, 0) + count
+            if self.timeouts[rule_name] >= self.quarantine_after and rule_name not in self.quarantined:
+                self.quarantined = self.quarantined | {rule_name}
+                logging.error(f"Rule {rule_name} timed out {self.timeouts[rule_name]} times and is quarantined for the rest of the run.")
+
+    def take_new_timeouts(self):
+        """Return the timeouts counted since the last call, so another process can merge them."""
+        with self.lock:
+            new_timeouts, self.new_timeouts = self.new_timeouts, {}
+        return new_timeouts
+
+    def quarantine(self, rule_names):
+        with self.lock:
+            self.quarantined = self.quarantined | frozenset(rule_names)
+
+    def report(self):
+        """Log the backend of every rule, then every rule that timed out during the run and whether it was quarantined."""
+        for rule_name, backend in self.backends.items():
+            logging.info(f"Rule {rule_name} ran on the {backend} backend.")
+        if not self.timeouts:
+            logging.info("No rule timed out during the run.")
+        for rule_name, count in sorted(self.timeouts.items(), key=lambda item: -item[1]):
+            status = "quarantined" if rule_name in self.quarantined else "not quarantined"
+            logging.warning(f"Rule {rule_name} timed out {count} times ({status}).")
+
+    def line_of(self, text, start, end):
+        """Return the line(s) of text that the span start:end covers."""
+        line_start = text.rfind(self.newline, 0, start) + 1
+        line_end = text.find(self.newline, end)
+        return text[line_start:line_end if line_end != -1 else len(text)]
+
+    def scan_stream(self, chunks, overlap=4096, inconclusive=None):
+        """Scan an iterable of text chunks without joining them.
+
+        The last `overlap` characters of each window are carried into the next
+        one so matches crossing a chunk boundary are still found. Offsets are
+        relative to the whole stream, and reading stops once every rule matched.
+        """
+        matches = {}
+        tail = ''
+        offset = 0  # Stream offset of the start of tail
+        for chunk in chunks:
+            window = tail + chunk
+            for rule_name, start, end in self.scan(window, skip=matches, inconclusive=inconclusive):
+                matches[rule_name] = (rule_name, offset + start, offset + end)
+            if len(matches) == len(self.rules):
+                break
+            tail = window[-overlap:] if overlap else ''
+            offset += len(window) - len(tail)
+        return list(matches.values())
+
+########################
+# File Classification
+########################
+
+def glob_to_regex(glob):
+    """Translate a gitignore-style glob into a regex matched against a '/'-separated path relative to the repository root."""
+    directory_only = glob.endswith('/')
+    anchored = '/' in glob.rstrip('/')  # A leading or middle '/' anchors the glob to the repository root
+    glob = glob.strip('/')
+    parts = []
+    index = 0
+    while index < len(glob):
+        if glob.startswith('**/', index):
+            parts.append('(?:.*/)?')
+            index += 3
+        elif glob.startswith('**', index):
+            parts.append('.*')
+            index += 2
+        elif glob[index] == '*':
+            parts.append('[^/]*')
+            index += 1
+        elif glob[index] == '?':
+            parts.append('[^/]')
+            index += 1
+        elif glob[index] == '[' and ']' in glob[index + 1:]:
+            end = glob.index(']', index + 1)
+            parts.append('[' + glob[index + 1:end].replace('!', '^', 1) + ']')
+            index = end + 1
+        else:
+            parts.append(re.escape(glob[index]))
+            index += 1
+    prefix = '' if anchored else '(?:.*/)?'
+    suffix = '/.*' if directory_only else '(?:/.*)?'
+    return f"^{prefix}{''.join(parts)}{suffix}$"
+
+class FileClassifier:
+    """Decides which files are worth scanning, before and after their content is read.
+
+    Paths are checked against pruned directories, gitignore-style exclude and
+    include globs and the scanned extensions; content is checked for binary,
+    minified and generated files. Only files with minified_extensions are
+    checked for minified content, and only source files with
+    generated_extensions for generated_markers, so one-line JSON or long log
+    lines are still scanned. Every decision to skip comes with a reason.
+    """
+
+    def __init__(self, extensions, prune_directories, exclude_globs, include_globs, binary_extensions=(),
+                 generated_markers=(), generated_extensions=(), minified_line_length=1000, minified_extensions=(),
+                 scan_extensionless=True):
+        self.extensions = tuple(extensions)
+        self.binary_extensions = tuple(binary_extensions)
+        self.prune_directories = set(prune_directories)
+        self.exclude_globs = [(glob.startswith('!'), re.compile(glob_to_regex(glob.lstrip('!')))) for glob in exclude_globs]
+        self.include_globs = [re.compile(glob_to_regex(glob)) for glob in include_globs]
+        self.generated_markers = [marker.encode('utf-8') for marker in generated_markers]
+        self.generated_extensions = tuple(generated_extensions)
+        self.minified_line_length = minified_line_length
+        self.minified_extensions = tuple(minified_extensions)
+        self.scan_extensionless = scan_extensionless
+
+    def prune(self, root, dirs):
+        """Remove pruned directories from an os.walk dirs list in place."""
+        for directory in [directory for directory in dirs if directory in self.prune_directories or directory == '.git']:
+            dirs.remove(directory)
+            if directory != '.git':
+                logging.info(f"Skipping directory {os.path.join(root, directory)}: vendored or third-party directory")
+
+    def classify_path(self, file_path):
+        """Return None when file_path should be scanned, otherwise the reason to skip it."""
+        path = file_path.replace(os.sep, '/')
+        parts = path.split('/')
+        if '.git' in parts:
+            return "git metadata"
+        if self.prune_directories.intersection(parts[:-1]):
+            return "vendored or third-party directory"
+        excluded = False
+        for negated, pattern in self.exclude_globs:
+            if pattern.match(path):
+                excluded = not negated
+        if excluded:
+            return "matches an exclude glob"
+        if any(pattern.match(path) for pattern in self.include_globs):
+            return None
+        name = path.rsplit('/', 1)[-1]
+        if name.lower().endswith(self.extensions):
+            return None
+        if self.scan_extensionless and (not os.path.splitext(name)[1] or name.startswith('.env')):
+            return None  # Content is sniffed before scanning
+        return "extension not scanned"
+
+    def classify_content(self, head, file_path):
+        """Return None when a file starting with head should be scanned, otherwise the reason to skip it."""
+        name = file_path.lower()
+        if b"\0" in head:
+            if name.endswith(self.binary_extensions):
+                return None
+            return "binary content"
+        if name.endswith(self.generated_extensions) and any(marker in head for marker in self.generated_markers):
+            return "generated file"
+        if (name.endswith(self.minified_extensions) and len(head) >= 1024
+                and len(head) / (head.count(b"\n") + 1) > self.minified_line_length):
+            return "minified content"
+        return None
+
+########################
+# Scan Processes
+########################
+
+class ContentScanner:
+    """Classifies raw file content and runs the rule set on what is worth scanning.
+
+    Lines containing exclude_line are not reported. Only the leading
+    sniff_bytes of a file are used to classify it.
+    """
+
+    def __init__(self, rule_set, classifier, sniff_bytes, exclude_line=None):
+        self.rule_set = rule_set
+        self.classifier = classifier
+        self.sniff_bytes = sniff_bytes
+        self.exclude_line = exclude_line
+
+    def scan_content(self, content, file_path):
+        """Return the (rule_name, start, end) matches in raw file content, given as bytes or an mmap."""
+        if not content:
+            return []
+        reason = self.classifier.classify_content(content[:self.sniff_bytes], file_path)
+        if reason:
+            logging.info(f"Skipping {file_path}: {reason}")
+            return []
+        try:
+            inconclusive = []
+            matches = self.rule_set.scan(content, exclude_line=self.exclude_line, inconclusive=inconclusive)
+            if inconclusive:
+                logging.warning(f"Rules {', '.join(inconclusive)} timed out on file {file_path}, their result is inconclusive.")
+            return matches
+        except Exception as e:
+            logging.warning(f"Failed to check file {file_path}: {e}")
+        return []
+
+    def scan_file(self, local_path, file_path):
+        """Scan a file on disk through mmap, so its content is never copied into memory."""
+        try:
+            with open(local_path, 'rb') as file:
+                if os.fstat(file.fileno()).st_size == 0:
+                    return []
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as content:
+                    return self.scan_content(content, file_path)
+        except Exception as e:
+            logging.warning(f"Failed to check file {file_path}: {e}")
+        return []
+
+SCANNER = None  # The ContentScanner of this process, set by init_scanner
+
+def init_scanner(patterns, rule_options, classifier, sniff_bytes, exclude_line=None, log_file=None):
+    """Compile the rules into this process's ContentScanner and return it.
+
+    Also the initializer of scan processes, which set up their own logging to
+    log_file since they don't inherit the main process's handlers.
+    """
+    global SCANNER
+    if log_file and not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s: %(message)s',
+                            handlers=[logging.StreamHandler(), logging.FileHandler(log_file)])
+    SCANNER = ContentScanner(RuleSet(patterns, **rule_options), classifier, sniff_bytes, exclude_line)
+    return SCANNER
+
+def scan_content(content, file_path):
+    return SCANNER.scan_content(content, file_path)
+
+def scan_file(local_path, file_path):
+    return SCANNER.scan_file(local_path, file_path)
+
+def scan_batch(batch, quarantined):
+    """Run a batch of (scan_function, args) in a scan process, using the rules compiled when it started.
+
+    Rules quarantined by the main process are skipped, and the timeouts seen
+    here are returned with the results so the main process can count them.
+    """
+    SCANNER.rule_set.quarantine(quarantined)
+    return [function(*args) for function, args in batch], SCANNER.rule_set.take_new_timeouts()
+
+########################
+# Findings Output
+########################
+
+class FindingsSink:
+    """Findings written by one background thread in batches, as CSV, JSONL or SARIF.
+
+    CSV and JSONL files are appended to and flushed per batch, with fsync at
+    most every fsync_interval seconds. SARIF is a single document, so it is
+    written in full when the sink is closed; its regions use character or
+    byte offsets, as given by offset_unit ('char' or 'byte'), or the line of
+    findings that only have one.
+    """
+
+    FILE_EXTENSIONS = {'csv': '.csv', 'jsonl': '.jsonl', 'sarif': '.sarif'}
+
+    def __init__(self, file_path, columns, output_format='csv', tool_name='', location_key='url', offset_unit='char',
+                 batch_size=200, flush_interval=2.0, fsync_interval=10.0):
+        if output_format not in self.FILE_EXTENSIONS:
+            raise ValueError(f"Unsupported output format '{output_format}', expected one of {sorted(self.FILE_EXTENSIONS)}")
+        self.file_path = os.path.splitext(file_path)[0] + self.FILE_EXTENSIONS[output_format]
+        self.columns = columns
+        self.output_format = output_format
+        self.tool_name = tool_name
+        self.location_key = location_key
+        self.offset_unit = offset_unit
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.queue = Queue()
+        self.sarif_results = []
+        self.thread = None
+        self.closed = False
+        self.lock = Lock()
+
+    def add(self, finding):
+        """Queue a finding dict; the writer thread is started on first use."""
+        with self.lock:
+            if self.closed:
+                logging.error(f"Findings sink is closed, dropping finding: {finding}")
+                return
+            if self.thread is None:
+                self.thread = Thread(target=self.run, daemon=True)
+                self.thread.start()
+        self.queue.put(finding)
+
+    def close(self):
+        """Write all queued findings and stop the writer thread."""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            thread = self.thread
+        if thread is not None:
+            self.queue.put(None)
+            thread.join()
+
+    def run(self):
+        file = None
+        try:
+            if self.output_format != 'sarif':
+                new_file = not os.path.exists(self.file_path) or os.path.getsize(self.file_path) == 0
+                file = open(self.file_path, mode='a', newline='')
+                if self.output_format == 'csv' and new_file:
+                    csv.writer(file).writerow([header for _, header in self.columns])
+            batch = []
+            last_flush = last_fsync = time.monotonic()
+            done = False
+            while not done:
+                try:
+                    finding = self.queue.get(timeout=self.flush_interval)
+                    if finding is None:
+                        done = True
+                    else:
+                        batch.append(finding)
+                except Empty:
+                    pass
+                now = time.monotonic()
+                if batch and (done or len(batch) >= self.batch_size or now - last_flush >= self.flush_interval):
+                    self.write_batch(file, batch)
+                    batch = []
+                    last_flush = now
+                if file and (done or now - last_fsync >= self.fsync_interval):
+                    file.flush()
+                    os.fsync(file.fileno())
+                    last_fsync = now
+            if self.output_format == 'sarif':
+                self.write_sarif()
+        except Exception as e:
+            logging.error(f"Failed to write findings to '{self.file_path}': {e}")
+        finally:
+            if file:
+                file.close()
+
+    def write_batch(self, file, batch):
+        if self.output_format == 'csv':
+            csv.writer(file).writerows([[finding.get(key, '') for key, _ in self.columns] for finding in batch])
+        elif self.output_format == 'jsonl':
+            file.write(''.join(json.dumps(finding) + '\n' for finding in batch))
+        else:
+            self.sarif_results.extend(batch)
+            return
+        file.flush()
+
+    def write_sarif(self):
+        results = []
+        for finding in self.sarif_results:
+            location = {"artifactLocation": {"uri": finding.get(self.location_key, '')}}
+            if 'start' in finding and 'end' in finding:
+                location["region"] = {f"{self.offset_unit}Offset": finding['start'], f"{self.offset_unit}Length": finding['end'] - finding['start']}
+            elif 'line' in finding:
+                location["region"] = {"startLine": finding['line']}
+            results.append({
+                "ruleId": finding['rule_name'],
+                "level": "error",
+                "message": {"text": f"Found {finding['rule_name']} pattern"},
+                "locations": [{"physicalLocation": location}],
+                "properties": {key: value for key, value in finding.items() if key not in ('rule_name', 'start', 'end', 'line')}
+            })
+        document = {
+            "version": "2.1.0",
+            "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+            "runs": [{
+                "tool": {"driver": {"name": self.tool_name, "rules": [{"id": rule_id} for rule_id in sorted({result["ruleId"] for result in results})]}},
+                "results": results
+            }]
+        }
+        temp_path = self.file_path + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump(document, file, indent=2)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.file_path)
+
+########################
+# Rate Limiting
+########################
+
+class RateLimiter:
+    """Process-wide token bucket that every API call passes through, adjusted AIMD-style.
+
+    The request rate and the number of requests in flight grow additively
+    while the API answers normally, and are halved when it throttles (a 429,
+    or X-RateLimit-NearLimit / a low X-RateLimit-Remaining). They are halved
+    at most once per Retry-After or round trip, so a burst of throttled
+    responses to requests sent together counts once. A 429 also pauses every
+    thread for its Retry-After.
+    """
+
+    def __init__(self, rate, max_rate, max_concurrency, min_rate=0.5, rate_step=0.05, default_retry_after=10):
+        self.rate = rate
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.rate_step = rate_step
+        self.concurrency = max_concurrency
+        self.max_concurrency = max_concurrency
+        self.default_retry_after = default_retry_after
+        self.tokens = 1.0
+        self.last_refill = time.monotonic()
+        self.paused_until = 0
+        self.decreased_until = 0  # Throttled responses before this are part of the last decrease
+        self.round_trip = 0.0  # Moving average of the response time, in seconds
+        self.in_flight = 0
+        self.condition = Condition()
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        with self.condition:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.last_refill) * self.rate)
+                self.last_refill = now
+                if now < self.paused_until:
+                    self.condition.wait(self.paused_until - now)
+                elif self.in_flight >= int(self.concurrency):
+                    self.condition.wait()
+                elif self.tokens < 1:
+                    self.condition.wait((1 - self.tokens) / self.rate)
+                else:
+                    self.tokens -= 1
+                    self.in_flight += 1
+                    return
+
+    def release(self, response=None, keep_slot=False):
+        """Finish a request and adapt the limits to its response, if one was received.
+
+        With keep_slot, the request stays in flight until release() is called
+        again, for a response whose body is still being read.
+        """
+        with self.condition:
+            if not keep_slot:
+                self.in_flight -= 1
+            if response is not None:
+                self.observe(response)
+            self.condition.notify_all()
+
+    def observe(self, response):
+        headers = response.headers
+        elapsed = getattr(response, 'elapsed', None)
+        if elapsed is not None:
+            self.round_trip = 0.8 * self.round_trip + 0.2 * elapsed.total_seconds()
+        if response.status_code == 429:
+            retry_after = self.parse_retry_after(headers.get('Retry-After'))
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+            self.decrease(retry_after)
+            logging.warning(f"Rate limited by the API, pausing all requests for {retry_after:.1f}s; now at {self.rate:.2f} requests/s and {int(self.concurrency)} in flight.")
+            return
+        remaining, limit = headers.get('X-RateLimit-Remaining'), headers.get('X-RateLimit-Limit')
+        near_limit = headers.get('X-RateLimit-NearLimit', '').lower() == 'true'
+        if remaining and limit and remaining.isdigit() and limit.isdigit() and int(limit) > 0:
+            near_limit = near_limit or int(remaining) < int(limit) * 0.1
+        if near_limit:
+            self.decrease()
+        else:
+            self.rate = min(self.max_rate, self.rate + self.rate_step)
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / max(1, self.concurrency))
+
+    def decrease(self, retry_after=0):
+        """Halve the limits, unless they were already halved within the current Retry-After or round trip."""
+        now = time.monotonic()
+        if now < self.decreased_until:
+            return
+        self.decreased_until = now + max(retry_after, self.round_trip)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.concurrency = max(1, int(self.concurrency) // 2)
+
+    def parse_retry_after(self, value):
+        """Return the Retry-After header in seconds, given as seconds or as an HTTP date."""
+        if not value:
+            return self.default_retry_after
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        try:
+            return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+        except (TypeError, ValueError):
+            return self.default_retry_after
+
+########################
+# False Positives
+########################
+
+def load_false_positives(file_path):
+    """Load false positive keys (issue keys or file paths) from file."""
+    false_positives = set()
+    try:
+        with open(file_path, 'r') as file:
+            for line in file:
+                if line.strip():
+                    false_positives.add(line.strip())
+    except Exception as e:
+        logging.error(f"Failed to read false positives from {file_path}: {e}")
+    return false_positives
+
+class FalsePositiveStore:
+    """False positive keys shared by all threads, reloaded only when the file's mtime changes.
+
+    When file_path does not exist but legacy_file_path does, the legacy file is read instead.
+    """
+
+    def __init__(self, file_path, legacy_file_path=None, check_interval=5):
+        if not os.path.exists(file_path) and legacy_file_path and os.path.exists(legacy_file_path):
+            logging.warning(f"{file_path} not found, using legacy {legacy_file_path}. Please rename it.")
+            file_path = legacy_file_path
+        if not os.path.exists(file_path):
+            with open(file_path, 'w') as file:
+                logging.info(f"{file_path} not found. Creating new file.")
+        self.file_path = file_path
+        self.check_interval = check_interval
+        self.false_positives = set()
+        self.mtime = None
+        self.last_check = None
+        self.lock = Lock()
+        self.refresh()
+
+    def refresh(self):
+        """Reload the file if it changed, stat-ing it at most once per check interval."""
+        now = time.monotonic()
+        if self.last_check is not None and now - self.last_check < self.check_interval:
+            return
+        with self.lock:
+            if self.last_check is not None and now - self.last_check < self.check_interval:
+                return
+            self.last_check = now
+            try:
+                mtime = os.stat(self.file_path).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime != self.mtime:
+                self.false_positives = load_false_positives(self.file_path) if mtime is not None else set()
+                self.mtime = mtime
+                logging.info(f"Loaded {len(self.false_positives)} false positives from {self.file_path}")
+
+    def __contains__(self, key):
+        self.refresh()
+        return key in self.false_positives
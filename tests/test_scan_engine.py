@@ -0,0 +1,147 @@
+import re
+import unittest
+
+from scan_engine import FileClassifier, RuleSet, extract_required_literal, glob_to_regex
+
+
+class ExtractRequiredLiteralTest(unittest.TestCase):
+
+    def test_escape_arguments_are_not_literal(self):
+        cases = {
+            r'\p{Lu}abcdef': 'abcdef',
+            r'\P{Lu}abcdef': 'abcdef',
+            r'\pLabcdef': 'abcdef',
+            r'\N{LATIN SMALL LETTER A}bcdef': 'bcdef',
+            r'\x41bcdefg': 'bcdefg',
+            r'\x{41}bcdefg': 'bcdefg',
+            r'\u0041bcdefg': 'bcdefg',
+            r'\U00000041bcdefg': 'bcdefg',
+            r'\012bcdefg': 'bcdefg',
+            r'\101bcdefg': 'bcdefg',
+        }
+        for pattern, literal in cases.items():
+            with self.subTest(pattern=pattern):
+                self.assertEqual(extract_required_literal(pattern), (literal, False))
+
+    def test_escaped_punctuation_is_literal(self):
+        self.assertEqual(extract_required_literal(r'api\.key\d+'), ('api.key', False))
+
+    def test_fuzzy_constraints_are_not_literal(self):
+        self.assertIsNone(extract_required_literal(r'(?:password){e<=1}'))
+        self.assertEqual(extract_required_literal(r'secret\d{2,4}'), ('secret', False))
+
+    def test_fuzzy_rules_still_match(self):
+        rule_set = RuleSet([('fuzzy', r'(?:password){e<=1}=\w+')])
+        self.assertEqual([rule_name for rule_name, _, _ in rule_set.scan('passwrd=hunter2')], ['fuzzy'])
+
+    def test_rules_with_escape_arguments_still_match(self):
+        rules = [
+            ('property', r'\p{Lu}bcdefg'),
+            ('hex', r'\x41bcdefg'),
+            ('unicode', r'\u0041bcdefg'),
+            ('unicode_long', r'\U00000041bcdefg'),
+            ('named', r'\N{LATIN CAPITAL LETTER A}bcdefg'),
+            ('octal', r'\101bcdefg'),
+        ]
+        rule_set = RuleSet(rules)
+        found = {rule_name for rule_name, _, _ in rule_set.scan('xx Abcdefg yy')}
+        self.assertEqual(found, {rule_name for rule_name, _ in rules})
+
+
+class BinaryRuleSetTest(unittest.TestCase):
+
+    def test_unicode_rules_report_byte_offsets(self):
+        rule_set = RuleSet([('property', r'\p{Lu}bcdefg'), ('accent', r'clé=\d+'), ('ascii', r'token=\d+')], binary=True)
+        text = b'\xff' + 'é Abcdefg clé=42 token=7'.encode('utf-8')
+        matches = {rule_name: text[start:end] for rule_name, start, end in rule_set.scan(text)}
+        self.assertEqual(matches, {'property': b'Abcdefg', 'accent': 'clé=42'.encode('utf-8'), 'ascii': b'token=7'})
+
+    def test_unicode_rules_skip_excluded_lines(self):
+        rule_set = RuleSet([('accent', r'clé=\d+')], binary=True)
+        text = 'password=${clé=1}\nclé=2'.encode('utf-8')
+        [(_, start, end)] = rule_set.scan(text, exclude_line=b'password=${')
+        self.assertEqual(text[start:end], 'clé=2'.encode('utf-8'))
+
+
+
+
+class ScanStreamTest(unittest.TestCase):
+
+    def test_match_across_chunk_boundary(self):
+        rule_set = RuleSet([('token', r'token=[a-z]{12}')])
+        text = 'x' * 50 + 'token=abcdefghijkl' + 'y' * 50
+        chunks = [text[i:i + 7] for i in range(0, len(text), 7)]
+        [(_, start, end)] = rule_set.scan_stream(chunks, overlap=32)
+        self.assertEqual(text[start:end], 'token=abcdefghijkl')
+
+    def test_offsets_are_relative_to_the_stream(self):
+        rule_set = RuleSet([('token', r'token=\d+'), ('key', r'key=\d+')])
+        text = 'a' * 100 + 'token=1 ' + 'b' * 100 + 'key=2 '
+        chunks = [text[i:i + 30] for i in range(0, len(text), 30)]
+        matches = {rule_name: text[start:end] for rule_name, start, end in rule_set.scan_stream(chunks, overlap=10)}
+        self.assertEqual(matches, {'token': 'token=1', 'key': 'key=2'})
+
+    def test_match_in_overlap_is_reported_once(self):
+        rule_set = RuleSet([('token', r'token=\d+')])
+        self.assertEqual(len(rule_set.scan_stream(['xx token=1 ', 'yy', 'zz'], overlap=20)), 1)
+
+class GlobToRegexTest(unittest.TestCase):
+
+    def matches(self, glob, path):
+        return bool(re.match(glob_to_regex(glob), path))
+
+    def test_leading_slash_anchors_to_the_root(self):
+        self.assertTrue(self.matches('/build/', 'build/app.js'))
+        self.assertFalse(self.matches('/build/', 'src/build/app.js'))
+        self.assertFalse(self.matches('/build/', 'build'))
+
+    def test_unanchored_directory_matches_at_any_depth(self):
+        self.assertTrue(self.matches('build/', 'build/app.js'))
+        self.assertTrue(self.matches('build/', 'src/build/app.js'))
+
+    def test_middle_slash_anchors_to_the_root(self):
+        self.assertTrue(self.matches('docs/*.md', 'docs/readme.md'))
+        self.assertFalse(self.matches('docs/*.md', 'src/docs/readme.md'))
+        self.assertFalse(self.matches('docs/*.md', 'docs/api/readme.md'))
+
+    def test_double_star_crosses_directories(self):
+        self.assertTrue(self.matches('docs/**/*.md', 'docs/api/v1/readme.md'))
+        self.assertTrue(self.matches('**/fixtures', 'a/b/fixtures/key.pem'))
+
+
+class FileClassifierTest(unittest.TestCase):
+
+    def classifier(self, **options):
+        settings = {'extensions': ('.json', '.js', '.py'), 'prune_directories': ('node_modules',),
+                    'exclude_globs': (), 'include_globs': ()}
+        settings.update(options)
+        return FileClassifier(**settings)
+
+    def test_negated_exclude_glob_includes_the_file_again(self):
+        classifier = self.classifier(exclude_globs=('tests/', '!tests/config.py'))
+        self.assertEqual(classifier.classify_path('tests/test_app.py'), "matches an exclude glob")
+        self.assertIsNone(classifier.classify_path('tests/config.py'))
+
+    def test_pruned_directories(self):
+        classifier = self.classifier()
+        self.assertEqual(classifier.classify_path('web/node_modules/lib/index.js'), "vendored or third-party directory")
+        self.assertIsNone(classifier.classify_path('web/src/index.js'))
+        dirs = ['node_modules', '.git', 'src']
+        classifier.prune('repo', dirs)
+        self.assertEqual(dirs, ['src'])
+
+    def test_single_line_json_is_not_minified(self):
+        classifier = self.classifier(minified_line_length=100, minified_extensions=('.js',))
+        head = b'{"token": "' + b'a' * 4000 + b'"}'
+        self.assertIsNone(classifier.classify_content(head, 'config.json'))
+        self.assertEqual(classifier.classify_content(head, 'bundle.min.js'), "minified content")
+
+    def test_generated_markers_only_apply_to_generated_extensions(self):
+        classifier = self.classifier(generated_markers=('@generated',), generated_extensions=('.py',))
+        head = b'# @generated\napi_key = "x"\n'
+        self.assertEqual(classifier.classify_content(head, 'models_pb2.py'), "generated file")
+        self.assertIsNone(classifier.classify_content(head, 'notes.json'))
+
+
+if __name__ == '__main__':
+    unittest.main()